@@ -7,28 +7,156 @@ if sys.version_info[0] != 3:
 
 import os
 from os.path import join, exists
-from bs4 import BeautifulSoup
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from lxml import etree
+from lxml import html as lxml_html
 import re
 from pkg_resources import resource_stream
 
 EXAMPLE_PAGE = resource_stream(__name__, 'data/1.1.3.15.html').name
 
+HTML_PARSER = lxml_html.HTMLParser(encoding='ISO-8859-1')
+
+# compiled once, used for every div in every table, case-insensitive so
+# that callers need not uppercase whole cells before matching
+UNIPROT_REGEX = re.compile('([OPQ][0-9](?:[A-Z0-9]){3}[0-9]|[A-NR-Z][0-9](?:[A-Z][A-Z0-9]{2}[0-9]){1,2})', re.IGNORECASE)
+
+# removes all whitespace from a value cell in a single pass
+WHITESPACE_TABLE = str.maketrans('', '', ' \t\n\r')
+
+# selectors compiled once instead of once per parsed page
+TABLE_XPATH = etree.XPath('//div[@id=$tid]')
+HEADER_XPATH = etree.XPath(".//div[@class='header']")
+
+# matches the id of a table div, but not of the rows and cells inside it
+TABLE_ID_REGEX = re.compile(r'tab\d+')
+
+# matches a plain number or a range like "30-40" or "30to40"
+NUMBER_REGEX = re.compile(r'(-?\d+(?:\.\d+)?)(?:(?:-|to)(-?\d+(?:\.\d+)?))?')
+
 def open_ec(filepath):
     '''
     Open the EC html file that should be parsed.
-    Return a soup instance.
+    Return the root element of the parsed document tree.
+    '''
+    return lxml_html.parse(filepath, parser=HTML_PARSER).getroot()
+
+
+def open_ec_streamed(filepath, target_ids):
     '''
-    with open(filepath, 'r', encoding='ISO-8859-1') as f:
-        soup = BeautifulSoup(f, 'html.parser')
-    return soup
+    Stream-parse the EC html file, yielding (table_id, element) for each
+    requested table div.
+    The document is never held in memory as a whole, processed parts are
+    discarded as the parse moves along, so this is useful for pulling one
+    or two tables out of very large EC pages.
+    The yielded elements can be passed to the table classes in place of a
+    full document tree.
+    '''
+    target_ids = set(target_ids)
+    for event, elem in etree.iterparse(filepath, events=('end',), tag='div', html=True, encoding='ISO-8859-1'):
+        div_id = elem.get('id')
+
+        #only act on complete tables, the rows and cells inside them
+        #carry ids as well (like "tab41r0c2") and must not be discarded
+        if div_id is None or TABLE_ID_REGEX.fullmatch(div_id) is None:
+            continue
+
+        if div_id in target_ids:
+            yield div_id, lxml_html.fromstring(etree.tostring(elem, encoding='unicode'))
+
+        #discard the subtree and everything parsed before it
+        elem.clear(keep_tail=True)
+        parent = elem.getparent()
+        if parent is not None:
+            while elem.getprevious() is not None:
+                del parent[0]
 
 
 def get_identifiers_from_html(my_string):
     '''
     Alternate way to get all identifiers.
     http://www.uniprot.org/help/accession_numbers
+    The identifiers are matched regardless of case and returned uppercased.
     '''
-    return re.findall('([OPQ][0-9](?:[A-Z0-9]){3}[0-9]|[A-NR-Z][0-9](?:[A-Z][A-Z0-9]{2}[0-9]){1,2})', my_string)
+    return [s.upper() for s in UNIPROT_REGEX.findall(my_string)]
+
+
+@lru_cache(maxsize=4096)
+def _normalize_name(organism):
+    '''
+    Normalize a single organism name.
+    Ignore strain designations.
+    Should be: "Escherichia coli"
+    The same organisms repeat many times on a page, so the results are cached.
+    The returned name is interned, since it is reused as a dictionary key
+    across tables and across EC files.
+    '''
+    assert type(organism) is str, 'Error, the organism names must be supplied as strings. The input "%s" is not.' % organism
+
+    # deal with organism names separated by _
+    if len(organism.split()) < len(organism.split('_')):
+        organism = ' '.join(organism.split('_'))
+
+    # take only the first two parts of the name
+    organism = ' '.join(organism.split()[:2]).rstrip(',.')
+
+    return sys.intern(organism.lower().capitalize())
+
+
+def _numeric_value(value):
+    '''
+    Convert the cleaned-up text of a value cell to a number.
+    Plain numbers give a float, ranges like "30-40" or "30to40" give the
+    rounded average and cells only holding "additional information" give None.
+    Raises ValueError on values that cannot be interpreted.
+    '''
+    # sometimes a number is given together with additional information,
+    # "0.018-additionalinformation", these cells carry no useful value
+    if 'additionalinformation' in value:
+        return None
+
+    match = NUMBER_REGEX.fullmatch(value)
+    if match is not None:
+        a, b = match.groups()
+        if b is None:
+            return float(a)
+        return round((float(a)+float(b))/2)
+
+    # rarities such as scientific notation
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    # ranges with parts the regex does not cover, like "1.5e2-3e2",
+    # "to" is tried first since it can never occur inside a float literal,
+    # while the "-" of a negative exponent ("1e-3to2e-3") can,
+    # raises on values that cannot be interpreted at all
+    a, sep, b = value.partition('to')
+    if not sep:
+        a, _, b = value.partition('-')
+    return round((float(a)+float(b))/2)
+
+
+
+class BrendaFile(object):
+    '''
+    Parse an EC html file once and index its table divs.
+    An instance can be passed to any number of table classes in place of
+    a document tree, so that one file parse and one indexing walk serve
+    them all.
+    '''
+    def __init__(self, filepath):
+        tree = open_ec(filepath)
+
+        #index all table divs in one walk over the document
+        self.tables = {}
+        for div in tree.iter('div'):
+            div_id = div.get('id')
+            if div_id is not None and TABLE_ID_REGEX.fullmatch(div_id) is not None:
+                self.tables[div_id] = div
 
 
 
@@ -36,33 +164,32 @@ class _BrendaBaseClass(object):
     '''
     Base class intended for subclassing.
     '''
-    def __init__(self, soup_instance):
-        self.soup = soup_instance
+    def __init__(self, tree):
+        #a pre-indexed BrendaFile can be passed in place of a tree
+        if isinstance(tree, BrendaFile):
+            tree = tree.tables.get(self.table_id)
+        self.tree = tree
 
 
     def _parse(self):
         '''
-        Perform the parsing
-        '''
-        self.grey1_data, self.grey2_data, self.hiddengrey1_data, self.hiddengrey2_data = self._get_table_divs()
-
-
-    def _normalize_name(self, organism):
-        '''
-        Normalize a single organism name.
-        Ignore strain designations.
-        Should be: "Escherichia coli"
+        Perform the parsing.
+        All row divs go straight into one combined data structure,
+        which is None when the table is absent from the page.
+        The document tree is released afterwards so that it can be garbage
+        collected in batch runs, get_data only needs the combined data.
         '''
-        assert type(organism) is str, 'Error, the organism names must be supplied as strings. The input "%s" is not.' % organism
+        divs = self._get_table_divs()
+        if divs is None:
+            self.combined_data = None
+        else:
+            self.combined_data = self._accumulate_rows(divs)
 
-        # deal with organism names separated by _
-        if len(organism.split()) < len(organism.split('_')):
-            organism = ' '.join(organism.split('_'))
+        self.tree = None
 
-        # take only the first two parts of the name
-        organism = ' '.join(organism.split()[:2]).rstrip(',.')
 
-        return organism.lower().capitalize()
+    # memoized module-level function, kept accessible as a method
+    _normalize_name = staticmethod(_normalize_name)
 
 
     def _parse_single_div(self, div):
@@ -72,9 +199,9 @@ class _BrendaBaseClass(object):
         raise NotImplementedError
 
 
-    def _split_divs(self, div_data):
+    def _accumulate_rows(self, divs):
         '''
-        Each table needs to have its own parsing of the table divs.
+        Each table needs to have its own accumulation of the parsed rows.
         This is the method where that should be implemented.
         '''
         raise NotImplementedError
@@ -85,27 +212,33 @@ class _BrendaBaseClass(object):
         Find the relevant table divs
         '''
 
-        #isolate the table with the given ID
-        table = self.soup.find("div", { "id" : self.table_id })
-        if table is None:
-            return None, None, None, None
-        else:
-            #print([s.get_text() for s in table.find_all("div", { "class" : "header" })])
-            assert any([self.table_name in s.get_text() for s in table.find_all("div", { "class" : "header" })]), 'Something is wrong with %s' % self.table_name
-
-            mydivs_grey1 = table.find_all("div", { "class" : "row rgrey1" })
-            grey1_data = self._split_divs(mydivs_grey1)
-
-            mydivs_grey2 = table.find_all("div", { "class" : "row rgrey2" })
-            grey2_data = self._split_divs(mydivs_grey2)
+        #the table is missing from the page (or from the BrendaFile index)
+        if self.tree is None:
+            return None
 
-            mydivs_hiddengrey1 = table.find_all("div", { "class" : "hidden rgrey1" })
-            hiddengrey1_data = self._split_divs(mydivs_hiddengrey1)
+        #isolate the table with the given ID, the tree may already be the
+        #table div itself (when it comes from open_ec_streamed or a BrendaFile)
+        if self.tree.get('id') == self.table_id:
+            table = [self.tree]
+        else:
+            table = TABLE_XPATH(self.tree, tid=self.table_id)
+        if not table:
+            return None
+        else:
+            table = table[0]
+            assert any([self.table_name in s.text_content() for s in HEADER_XPATH(table)]), 'Something is wrong with %s' % self.table_name
 
-            mydivs_hiddengrey2 = table.find_all("div", { "class" : "hidden rgrey2" })
-            hiddengrey2_data = self._split_divs(mydivs_hiddengrey2)
+            #bucket the row divs by their class in one pass,
+            #the rows are direct children of the table div, so there is no
+            #need to descend into the cell markup of every row
+            buckets = {'row rgrey1':[], 'row rgrey2':[], 'hidden rgrey1':[], 'hidden rgrey2':[]}
+            for div in table.iterchildren('div'):
+                bucket = buckets.get(div.get('class'))
+                if bucket is not None:
+                    bucket.append(div)
 
-            return grey1_data, grey2_data, hiddengrey1_data, hiddengrey2_data
+            #keep the order in which the four row classes used to be combined
+            return buckets['row rgrey1'] + buckets['row rgrey2'] + buckets['hidden rgrey1'] + buckets['hidden rgrey2']
 
 
 
@@ -116,8 +249,8 @@ class _ThreeLevelDiv(_BrendaBaseClass):
     "numeric" determines whether the first value in the table is expected to be numeric or not.
     The expected structure is "value, organism, uniprot_id"
     '''
-    def __init__(self, soup_instance, numeric):
-        _BrendaBaseClass.__init__(self, soup_instance)
+    def __init__(self, tree, numeric):
+        _BrendaBaseClass.__init__(self, tree)
         self.numeric = numeric
 
 
@@ -125,72 +258,43 @@ class _ThreeLevelDiv(_BrendaBaseClass):
         '''
         Extract the data from a single div
         '''
-        #there is an issue of the comments being appended to the last uniprot id
-        #need to parse the div twice, in two different ways to be able to filter
-        #out thse comments
-
-        #first make a list of potential uniprot ids
-        #critically these do not contain the comments
-        potential = []
-        for item in div.find_all("a"):
-            potential.append(item.get_text().upper())
-        potential = list(filter(None, potential))
-
-        #get all div text
-        text = div.get_text(',')
-        if len(text.split('\n')) > 3:
-            parts = text.split('\n')
-
-            #get value
-            value = parts[1].strip(',')
-            value = value.replace(' ', '')
-
-            # if value is numeric, convert to float, take average if nessecary
-            if self.numeric is True:
-                try:
-                    value = float(value)
-                except:
-                    if len(value.split('-')) == 2:
-                        a, b = value.split('-')
-                        # sometimes a number is given together with additional information
-                        # "0.018-additionalinformation", need to catch this exception
-                        if a == ',additionalinformation' or b == ',additionalinformation':
-                            return None
-                        value = round((float(a)+float(b))/2)
-                    elif len(value.split('to')) == 2:
-                        a, b = value.split('to')
-                        value = round((float(a)+float(b))/2)
-                    elif value == 'additionalinformation':
-                        return None
-                    else:
-                        print(value)
-                        raise ValueError
-
-            if value == 'additionalinformation':
+        #get the individual cell divs, the expected structure is "value, organism, uniprot_id, ..."
+        cells = div.findall('./div')
+        if len(cells) < 3:
+            return None
+
+        #get value, whitespace removed
+        value = cells[0].text_content().translate(WHITESPACE_TABLE).strip(',')
+
+        # if value is numeric, convert to float, take average if nessecary
+        if self.numeric is True:
+            value = _numeric_value(value)
+            if value is None:
                 return None
 
-            #get organism
-            organism = parts[2].strip(',')
-            organism = self._normalize_name(organism)
+        elif value == 'additionalinformation':
+            return None
 
-            #get a list of the uniprot ids, filter out comments and such by matching to the potential ones
-            uniprot_id_list = get_identifiers_from_html(parts[3].upper())
-            uniprot_id_list = [s for s in uniprot_id_list if s in potential or get_identifiers_from_html(s) != []]
+        #get organism
+        organism = cells[1].text_content().strip().strip(',')
+        organism = self._normalize_name(organism)
 
-            if uniprot_id_list == [''] or uniprot_id_list == []: # if uid is unknown
-                return value, organism, ['unknown']
-            else:
-                #print(value, organism, uniprot_id_list)
-                return value, organism, uniprot_id_list
+        #get a list of the uniprot ids, any comments appended to the last id
+        #are excluded already, since the regex only matches valid accessions
+        uniprot_id_list = [sys.intern(s) for s in get_identifiers_from_html(cells[2].text_content())]
+
+        if uniprot_id_list == [''] or uniprot_id_list == []: # if uid is unknown
+            return value, organism, ['unknown']
         else:
-            return None
+            #print(value, organism, uniprot_id_list)
+            return value, organism, uniprot_id_list
 
 
-    def _split_divs(self, divs):
+    def _accumulate_rows(self, divs):
         '''
-        Take the html section and parse out all divs
+        Parse all row divs and accumulate the data
         '''
-        all_data = {}
+        all_data = defaultdict(lambda: defaultdict(list))
         for div in divs:
 
             #parse the div
@@ -202,12 +306,7 @@ class _ThreeLevelDiv(_BrendaBaseClass):
             value, organism, uniprot_id_list = result
 
             #add to data structure
-            if all_data.get(organism) is None:
-                all_data[organism] = {}
-
             for uniprot_id in uniprot_id_list:
-                if all_data[organism].get(uniprot_id) is None:
-                    all_data[organism][uniprot_id] = []
                 all_data[organism][uniprot_id].append(value)
 
         return all_data
@@ -218,39 +317,25 @@ class _ThreeLevelDiv(_BrendaBaseClass):
         Extract the section of the HTML code that corresponds to the desired table.
         Then parse it and combine all the data.
         '''
-        found_at_least_one_uniprot_id = not uid_orgs_only
-
-        if self.grey1_data == None and self.grey2_data == None and self.hiddengrey1_data == None and self.hiddengrey2_data == None:
+        if self.combined_data is None:
             return None
 
-        else:
-            #combine the two datasets
-            combined_data = {}
-            for data in [self.grey1_data, self.grey2_data, self.hiddengrey1_data, self.hiddengrey2_data]:
-                for organism in data.keys():
-
-                    #if (uid_orgs_only is True and data[organism] != []) or (uid_orgs_only is False):
-
-                    if data[organism] != {}:
-                        for uniprot_id in data[organism].keys():
-
-                            if uniprot_id == 'unknown' and uid_orgs_only: # skip data not connected to a uid, if desired
-                                continue
-
-                            found_at_least_one_uniprot_id = True
+        found_at_least_one_uniprot_id = not uid_orgs_only
 
-                            if combined_data.get(organism) is None:
-                                combined_data[organism] = {}
+        data_out = {}
+        for organism, uids in self.combined_data.items():
+            for uniprot_id, values in uids.items():
 
-                            if combined_data[organism].get(uniprot_id) is None:
-                                combined_data[organism][uniprot_id] = []
+                if uniprot_id == 'unknown' and uid_orgs_only: # skip data not connected to a uid, if desired
+                    continue
 
-                            combined_data[organism][uniprot_id].extend(data[organism][uniprot_id])
+                found_at_least_one_uniprot_id = True
+                data_out.setdefault(organism, {})[uniprot_id] = list(values)
 
-            if found_at_least_one_uniprot_id is True:
-                return combined_data
-            else:
-                return None
+        if found_at_least_one_uniprot_id is True:
+            return data_out
+        else:
+            return None
 
 
 
@@ -261,8 +346,8 @@ class _FourLevelDiv(_BrendaBaseClass):
     "numeric" determines whether the first value in the table is expected to be numeric or not.
     The expected structure is "value, information, organism, uniprot_id"
     '''
-    def __init__(self, soup_instance, numeric):
-        _BrendaBaseClass.__init__(self, soup_instance)
+    def __init__(self, tree, numeric):
+        _BrendaBaseClass.__init__(self, tree)
         self.numeric = numeric
 
 
@@ -270,77 +355,49 @@ class _FourLevelDiv(_BrendaBaseClass):
         '''
 
         '''
-        #there is an issue of the comments being appended to the last uniprot id
-        #need to parse the div twice, in two different ways to be able to filter
-        #out thse comments
-
-        #first make a list of potential uniprot ids
-        #critically these do not contain the comments
-        potential = []
-        for item in div.find_all("a"):
-            potential.append(item.get_text().upper())
-        potential = list(filter(None, potential))
-
-        #get all div text
-        text = div.get_text(',')
-        if len(text.split('\n')) > 3:
-            parts = text.split('\n')
-            #print(parts)
-
-            #get value value
-            value = parts[1].strip(',')
-            value = value.replace(' ', '')
-
-            # if value is numeric, convert to float, take average if nessecary
-            if self.numeric is True:
-                try:
-                    value = float(value)
-                except:
-                    if len(value.split('-')) == 2:
-                        a, b = value.split('-')
-                        # sometimes a number is given together with additional information
-                        # "0.018-additionalinformation", need to catch this exception
-                        if a == ',additionalinformation' or b == ',additionalinformation':
-                            return None
-                        value = round((float(a)+float(b))/2)
-                    elif len(value.split('to')) == 2:
-                        a, b = value.split('to')
-                        value = round((float(a)+float(b))/2)
-                    elif value == 'additionalinformation':
-                        return None
-                    else:
-                        print(value)
-                        raise ValueError
-
-            if value == 'additionalinformation':
+        #get the individual cell divs, the expected structure is "value, information, organism, uniprot_id, ..."
+        cells = div.findall('./div')
+        if len(cells) < 4:
+            return None
+
+        #get value, whitespace removed
+        value = cells[0].text_content().translate(WHITESPACE_TABLE).strip(',')
+
+        # if value is numeric, convert to float, take average if nessecary
+        if self.numeric is True:
+            value = _numeric_value(value)
+            if value is None:
                 return None
 
-            # get the info cell
-            information = parts[2].strip(',')
+        elif value == 'additionalinformation':
+            return None
+
+        # get the info cell, interned since the same substrate names repeat
+        # as dictionary keys across many rows
+        information = sys.intern(cells[1].text_content().strip().strip(','))
 
-            #get organism
-            organism = parts[3].strip(',')
-            organism = self._normalize_name(organism)
+        #get organism
+        organism = cells[2].text_content().strip().strip(',')
+        organism = self._normalize_name(organism)
 
-            #get a list of the uniprot ids, filter out comments and such by matching to the potential ones
-            uniprot_id_list = get_identifiers_from_html(parts[4].upper())
-            uniprot_id_list = [s for s in uniprot_id_list if s in potential or get_identifiers_from_html(s) != []]
-            #print(uniprot_id_list)
+        #get a list of the uniprot ids, any comments appended to the last id
+        #are excluded already, since the regex only matches valid accessions
+        uniprot_id_list = [sys.intern(s) for s in get_identifiers_from_html(cells[3].text_content())]
 
-            if uniprot_id_list == [''] or uniprot_id_list == []: # if uid is unknown
-                return value, information, organism, ['unknown']
-            else:
-                #print(value, organism, uniprot_id_list)
-                return value, information, organism, uniprot_id_list
+        if uniprot_id_list == [''] or uniprot_id_list == []: # if uid is unknown
+            return value, information, organism, ['unknown']
         else:
-            return None
+            #print(value, organism, uniprot_id_list)
+            return value, information, organism, uniprot_id_list
 
 
-    def _split_divs(self, divs):
+    def _accumulate_rows(self, divs):
         '''
-        Take the html section and parse out all divs
+        Parse all row divs and accumulate the data
         '''
-        all_data = {}
+        #accumulate on a flat tuple key, one dict lookup per row instead of
+        #three chained ones
+        flat = defaultdict(list)
         for div in divs:
 
             #parse the div
@@ -351,17 +408,13 @@ class _FourLevelDiv(_BrendaBaseClass):
             value, information, organism, uniprot_id_list = result
 
             #add to data structure
-            if all_data.get(organism) is None:
-                all_data[organism] = {}
-
             for uniprot_id in uniprot_id_list:
-                if all_data[organism].get(uniprot_id) is None:
-                    all_data[organism][uniprot_id] = {}
+                flat[(organism, uniprot_id, information)].append(value)
 
-                if all_data[organism][uniprot_id].get(information) is None:
-                    all_data[organism][uniprot_id][information] = []
-
-                all_data[organism][uniprot_id][information].append(value)
+        #fold into the nested structure once at the end
+        all_data = defaultdict(lambda: defaultdict(dict))
+        for (organism, uniprot_id, information), values in flat.items():
+            all_data[organism][uniprot_id][information] = values
 
         return all_data
 
@@ -370,41 +423,25 @@ class _FourLevelDiv(_BrendaBaseClass):
         '''
         Extract the section of the HTML code that corresponds to the value
         '''
-        found_at_least_one_uniprot_id = not uid_orgs_only
-
-        if self.grey1_data == None and self.grey2_data == None and self.hiddengrey1_data == None and self.hiddengrey2_data == None:
+        if self.combined_data is None:
             return None
 
-        else:
-            #combine the two datasets
-            combined_data = {}
-            for data in [self.grey1_data, self.grey2_data, self.hiddengrey1_data, self.hiddengrey2_data]:
-                for organism in data.keys():
-
-                    if data[organism] != {}:
-                        for uniprot_id in data[organism].keys():
-
-                            if uniprot_id == 'unknown' and uid_orgs_only: # skip data not connected to a uid, if desired
-                                continue
-
-                            found_at_least_one_uniprot_id = True
-
-                            if combined_data.get(organism) is None:
-                                combined_data[organism] = {}
+        found_at_least_one_uniprot_id = not uid_orgs_only
 
-                            if combined_data[organism].get(uniprot_id) is None:
-                                combined_data[organism][uniprot_id] = {}
+        data_out = {}
+        for organism, uids in self.combined_data.items():
+            for uniprot_id, info in uids.items():
 
-                            for information in data[organism][uniprot_id].keys():
-                                if combined_data[organism][uniprot_id].get(information) is None:
-                                    combined_data[organism][uniprot_id][information] = []
+                if uniprot_id == 'unknown' and uid_orgs_only: # skip data not connected to a uid, if desired
+                    continue
 
-                                combined_data[organism][uniprot_id][information].extend(data[organism][uniprot_id][information])
+                found_at_least_one_uniprot_id = True
+                data_out.setdefault(organism, {})[uniprot_id] = {information: list(values) for information, values in info.items()}
 
-            if found_at_least_one_uniprot_id is True:
-                return combined_data
-            else:
-                return None
+        if found_at_least_one_uniprot_id is True:
+            return data_out
+        else:
+            return None
 
 
 
@@ -416,8 +453,8 @@ class _FiveLevelDiv(_BrendaBaseClass):
     "numeric" determines whether the first value in the table is expected to be numeric or not.
     The expected structure is "value1, value2, information, organism, uniprot_id"
     '''
-    def __init__(self, soup_instance, numeric):
-        _BrendaBaseClass.__init__(self, soup_instance)
+    def __init__(self, tree, numeric):
+        _BrendaBaseClass.__init__(self, tree)
         self.numeric = numeric
 
 
@@ -425,63 +462,40 @@ class _FiveLevelDiv(_BrendaBaseClass):
         '''
 
         '''
-        #there is an issue of the comments being appended to the last uniprot id
-        #need to parse the div twice, in two different ways to be able to filter
-        #out thse comments
-
-        #first make a list of potential uniprot ids
-        #critically these do not contain the comments
-        potential = []
-        for item in div.find_all("a"):
-            potential.append(item.get_text().upper())
-        potential = list(filter(None, potential))
-
-        #get all div text
-        text = div.get_text(',')
-        if len(text.split('\n')) > 3:
-            parts = text.split('\n')
-
-            # first one tends to be empty
-            if parts[0] == '':
-                parts = parts[1:]
-
-            # get rid of comma
-            parts = [s.strip(',') for s in parts]
+        #get the individual cell divs, the expected structure is "substrates, products, information, organism, uniprot_id, ..."
+        cells = div.findall('./div')
+        if len(cells) < 5:
+            return None
 
-            #get substrates and products
-            substrates = parts[0].split(' + ')
-            products = parts[1].split(' + ')
+        #get substrates and products
+        substrates = cells[0].text_content().strip().strip(',').split(' + ')
+        products = cells[1].text_content().strip().strip(',').split(' + ')
 
-            if substrates == ['additional information']:
-                return None
-
-            if products == ['additional information']:
-                return None
+        if substrates == ['additional information']:
+            return None
 
-            # get the info cell
-            information = parts[2].strip(',')
+        if products == ['additional information']:
+            return None
 
-            #get organism
-            organism = parts[3].strip(',')
-            organism = self._normalize_name(organism)
+        #get organism
+        organism = cells[3].text_content().strip().strip(',')
+        organism = self._normalize_name(organism)
 
-            #get a list of the uniprot ids, filter out comments and such by matching to the potential ones
-            uniprot_id_list = get_identifiers_from_html(parts[4].upper())
-            uniprot_id_list = [s for s in uniprot_id_list if s in potential or get_identifiers_from_html(s) != []]
+        #get a list of the uniprot ids, any comments appended to the last id
+        #are excluded already, since the regex only matches valid accessions
+        uniprot_id_list = [sys.intern(s) for s in get_identifiers_from_html(cells[4].text_content())]
 
-            if uniprot_id_list == [''] or uniprot_id_list == []: # if uid is unknown
-                return substrates, products, organism, ['unknown']
-            else:
-                return substrates, products, organism, uniprot_id_list
+        if uniprot_id_list == [''] or uniprot_id_list == []: # if uid is unknown
+            return substrates, products, organism, ['unknown']
         else:
-            return None
+            return substrates, products, organism, uniprot_id_list
 
 
-    def _split_divs(self, divs):
+    def _accumulate_rows(self, divs):
         '''
-        Take the html section and parse out all divs
+        Parse all row divs and accumulate the data
         '''
-        all_data = {}
+        all_data = defaultdict(lambda: defaultdict(list))
         for div in divs:
 
             #parse the div
@@ -492,13 +506,7 @@ class _FiveLevelDiv(_BrendaBaseClass):
             substrates, products, organism, uniprot_id_list = result
 
             #add to data structure
-            if all_data.get(organism) is None:
-                all_data[organism] = {}
-
             for uniprot_id in uniprot_id_list:
-                if all_data[organism].get(uniprot_id) is None:
-                    all_data[organism][uniprot_id] = []
-
                 all_data[organism][uniprot_id].append({'sub':substrates, 'prod':products})
 
         return all_data
@@ -508,37 +516,25 @@ class _FiveLevelDiv(_BrendaBaseClass):
         '''
         Extract the section of the HTML code that corresponds to the value
         '''
-        found_at_least_one_uniprot_id = not uid_orgs_only
-
-        if self.grey1_data == None and self.grey2_data == None and self.hiddengrey1_data == None and self.hiddengrey2_data == None:
+        if self.combined_data is None:
             return None
 
-        else:
-            #combine the two datasets
-            combined_data = {}
-            for data in [self.grey1_data, self.grey2_data, self.hiddengrey1_data, self.hiddengrey2_data]:
-                for organism in data.keys():
-
-                    if data[organism] != {}:
-                        for uniprot_id in data[organism].keys():
-
-                            if uniprot_id == 'unknown' and uid_orgs_only: # skip data not connected to a uid, if desired
-                                continue
-
-                            found_at_least_one_uniprot_id = True
+        found_at_least_one_uniprot_id = not uid_orgs_only
 
-                            if combined_data.get(organism) is None:
-                                combined_data[organism] = {}
+        data_out = {}
+        for organism, uids in self.combined_data.items():
+            for uniprot_id, reactions in uids.items():
 
-                            if combined_data[organism].get(uniprot_id) is None:
-                                combined_data[organism][uniprot_id] = []
+                if uniprot_id == 'unknown' and uid_orgs_only: # skip data not connected to a uid, if desired
+                    continue
 
-                            combined_data[organism][uniprot_id].extend(data[organism][uniprot_id])
+                found_at_least_one_uniprot_id = True
+                data_out.setdefault(organism, {})[uniprot_id] = list(reactions)
 
-            if found_at_least_one_uniprot_id is True:
-                return combined_data
-            else:
-                return None
+        if found_at_least_one_uniprot_id is True:
+            return data_out
+        else:
+            return None
 
 
 
@@ -547,11 +543,11 @@ class Organism(_BrendaBaseClass):
     Parsing the ORGANISM table in BRENDA.
     It's a special case as it has no data values, so I don't use subclassing of the other LevelDiv classes.
     '''
-    def __init__(self, soup_instance):
-        _BrendaBaseClass.__init__(self, soup_instance)
+    table_name = 'ORGANISM'
+    table_id = 'tab20'
 
-        self.table_name = 'ORGANISM'
-        self.table_id = 'tab20'
+    def __init__(self, tree):
+        _BrendaBaseClass.__init__(self, tree)
         self._parse()
 
 
@@ -559,49 +555,35 @@ class Organism(_BrendaBaseClass):
         '''
         '''
 
-        #there is an issue of the comments being appended to the last uniprot id
-        #need to parse the div twice, in two different ways to be able to filter
-        #out thse comments
-
-        #first make a list of potential uniprot ids
-        #critically these do not contain the comments
-        potential = []
-        for item in div.find_all("a"):
-            potential.append(item.get_text().upper())
-        potential = list(filter(None, potential))
-
-        #get all div text
-        text = div.get_text(',')
-        if len(text.split('\n')) > 3:
-            parts = text.split('\n')
-
+        #get the individual cell divs, the expected structure is "organism, common name, literature, uniprot_id, ..."
+        cells = div.findall('./div')
+        if len(cells) < 4:
+            return None
 
-            #get organism
-            organism = parts[1].strip('.,')
-            if organism.lower().strip().startswith('no activity'): # sometimes the organism field says, no activity in ... , get rid of this
-                return None
+        #get organism
+        organism = cells[0].text_content().strip().strip('.,')
+        if organism.lower().strip().startswith('no activity'): # sometimes the organism field says, no activity in ... , get rid of this
+            return None
 
-            organism = self._normalize_name(organism)
+        organism = self._normalize_name(organism)
 
-            #get a list of the uniprot ids, filter out comments and such by matching to the potential ones
-            uniprot_id_list = get_identifiers_from_html(parts[4].upper())
-            uniprot_id_list = [s for s in uniprot_id_list if (s in potential or get_identifiers_from_html(s) != []) and s != u'']
+        #get a list of the uniprot ids, any comments appended to the last id
+        #are excluded already, since the regex only matches valid accessions
+        uniprot_id_list = [sys.intern(s) for s in get_identifiers_from_html(cells[3].text_content())]
 
-            if uniprot_id_list == ['']: # if uid is unknown
-                return organism, []
-            else:
-                #print(temperature, organism, uniprot_id_list)
-                return organism, uniprot_id_list
+        if uniprot_id_list == ['']: # if uid is unknown
+            return organism, []
         else:
-            return None
+            #print(temperature, organism, uniprot_id_list)
+            return organism, uniprot_id_list
 
 
-    def _split_divs(self, divs):
+    def _accumulate_rows(self, divs):
         '''
-        Take the organism html section and parse out all divs.
+        Parse all organism row divs and accumulate the data.
 
         '''
-        all_data = {}
+        all_data = defaultdict(set)
         for div in divs:
 
             #parse the div
@@ -612,12 +594,8 @@ class Organism(_BrendaBaseClass):
             #get the data and process the temperature as an average (if a range is given) and convert to float
             organism, uniprot_id_list = result
 
-            #add to data structure
-            if all_data.get(organism) is None:
-                all_data[organism] = set([])
-
-            for uniprot_id in uniprot_id_list:
-                all_data[organism].add(uniprot_id)
+            #add to data structure, organisms without ids still get a (empty) record
+            all_data[organism].update(uniprot_id_list)
 
         return all_data
 
@@ -627,30 +605,22 @@ class Organism(_BrendaBaseClass):
         Extract the section of the HTML code that corresponds to the organisms.
         This is from the ORGANISM table in BRENDA.
         '''
+        if self.combined_data is None:
+            return None
+
         found_at_least_one_uniprot_id = not uid_orgs_only
 
-        if self.grey1_data == None and self.grey2_data == None and self.hiddengrey1_data == None and self.hiddengrey2_data == None:
-            return None
+        data_out = {}
+        for organism, uids in self.combined_data.items():
+            if (uid_orgs_only is True and uids != set([])) or (uid_orgs_only is False):
 
+                found_at_least_one_uniprot_id = True
+                data_out[organism] = sorted(uids) # convert to sorted list
+
+        if found_at_least_one_uniprot_id is True:
+            return data_out
         else:
-            #combine the two datasets
-            combined_data = {}
-            for data in [self.grey1_data, self.grey2_data, self.hiddengrey1_data, self.hiddengrey2_data]:
-                for organism in data.keys():
-                    if (uid_orgs_only is True and data[organism] != set([])) or (uid_orgs_only is False):
-
-                        if combined_data.get(organism) is None:
-                            combined_data[organism] = set([])
-
-                        found_at_least_one_uniprot_id = True
-                        combined_data[organism] = combined_data[organism] | data[organism]
-
-            if found_at_least_one_uniprot_id is True:
-                for key in combined_data.keys(): # convert to sorted list
-                    combined_data[key] = sorted(list(combined_data[key]))
-                return combined_data
-            else:
-                return None
+            return None
 
 
 
@@ -660,11 +630,11 @@ class TemperatureOptimum(_ThreeLevelDiv):
     '''
     Parsing the TEMPERATURE OPTIMUM table in BRENDA.
     '''
-    def __init__(self, soup_instance):
-        _ThreeLevelDiv.__init__(self, soup_instance, numeric=True)
+    table_name = 'TEMPERATURE OPTIMUM'
+    table_id = 'tab41'
 
-        self.table_name = 'TEMPERATURE OPTIMUM'
-        self.table_id = 'tab41'
+    def __init__(self, tree):
+        _ThreeLevelDiv.__init__(self, tree, numeric=True)
         self._parse()
 
 
@@ -672,11 +642,11 @@ class Cofactor(_ThreeLevelDiv):
     '''
     Parsing the COFACTOR table in BRENDA.
     '''
-    def __init__(self, soup_instance):
-        _ThreeLevelDiv.__init__(self, soup_instance, numeric=False)
+    table_name = 'COFACTOR'
+    table_id = 'tab48'
 
-        self.table_name = 'COFACTOR'
-        self.table_id = 'tab48'
+    def __init__(self, tree):
+        _ThreeLevelDiv.__init__(self, tree, numeric=False)
         self._parse()
 
 
@@ -684,11 +654,11 @@ class MetalsAndIons(_ThreeLevelDiv):
     '''
     Parsing the METALS and IONS table in BRENDA.
     '''
-    def __init__(self, soup_instance):
-        _ThreeLevelDiv.__init__(self, soup_instance, numeric=False)
+    table_name = 'METALS and IONS'
+    table_id = 'tab15'
 
-        self.table_name = 'METALS and IONS'
-        self.table_id = 'tab15'
+    def __init__(self, tree):
+        _ThreeLevelDiv.__init__(self, tree, numeric=False)
         self._parse()
 
 
@@ -696,11 +666,11 @@ class Inhibitors(_ThreeLevelDiv):
     '''
     Parsing the INHIBITORS table in BRENDA.
     '''
-    def __init__(self, soup_instance):
-        _ThreeLevelDiv.__init__(self, soup_instance, numeric=False)
+    table_name = 'INHIBITORS'
+    table_id = 'tab11'
 
-        self.table_name = 'INHIBITORS'
-        self.table_id = 'tab11'
+    def __init__(self, tree):
+        _ThreeLevelDiv.__init__(self, tree, numeric=False)
         self._parse()
 
 
@@ -708,11 +678,11 @@ class ActivatingCompound(_ThreeLevelDiv):
     '''
     Parsing the ACTIVATING COMPOUND table in BRENDA.
     '''
-    def __init__(self, soup_instance):
-        _ThreeLevelDiv.__init__(self, soup_instance, numeric=False)
+    table_name = 'ACTIVATING COMPOUND'
+    table_id = 'tab1'
 
-        self.table_name = 'ACTIVATING COMPOUND'
-        self.table_id = 'tab1'
+    def __init__(self, tree):
+        _ThreeLevelDiv.__init__(self, tree, numeric=False)
         self._parse()
 
 
@@ -720,11 +690,11 @@ class SpecificActivity(_ThreeLevelDiv):
     '''
     Parsing the SPECIFIC ACTIVITY table in BRENDA.
     '''
-    def __init__(self, soup_instance):
-        _ThreeLevelDiv.__init__(self, soup_instance, numeric=True)
+    table_name = 'SPECIFIC ACTIVITY [µmol/min/mg] '
+    table_id = 'tab34'
 
-        self.table_name = 'SPECIFIC ACTIVITY [µmol/min/mg] '
-        self.table_id = 'tab34'
+    def __init__(self, tree):
+        _ThreeLevelDiv.__init__(self, tree, numeric=True)
         self._parse()
 
 
@@ -732,11 +702,11 @@ class PhOptimum(_ThreeLevelDiv):
     '''
     Parsing the pH OPTIMUM table in BRENDA.
     '''
-    def __init__(self, soup_instance):
-        _ThreeLevelDiv.__init__(self, soup_instance, numeric=True)
+    table_name = 'pH OPTIMUM'
+    table_id = 'tab45'
 
-        self.table_name = 'pH OPTIMUM'
-        self.table_id = 'tab45'
+    def __init__(self, tree):
+        _ThreeLevelDiv.__init__(self, tree, numeric=True)
         self._parse()
 
 
@@ -744,11 +714,11 @@ class PhRange(_ThreeLevelDiv):
     '''
     Parsing the pH RANGE table in BRENDA.
     '''
-    def __init__(self, soup_instance):
-        _ThreeLevelDiv.__init__(self, soup_instance, numeric=True)
+    table_name = 'pH RANGE'
+    table_id = 'tab46'
 
-        self.table_name = 'pH RANGE'
-        self.table_id = 'tab46'
+    def __init__(self, tree):
+        _ThreeLevelDiv.__init__(self, tree, numeric=True)
         self._parse()
 
 
@@ -756,11 +726,11 @@ class TemperatureRange(_ThreeLevelDiv):
     '''
     Parsing the TEMPERATURE RANGE table in BRENDA.
     '''
-    def __init__(self, soup_instance):
-        _ThreeLevelDiv.__init__(self, soup_instance, numeric=True)
+    table_name = 'TEMPERATURE RANGE'
+    table_id = 'tab42'
 
-        self.table_name = 'TEMPERATURE RANGE'
-        self.table_id = 'tab42'
+    def __init__(self, tree):
+        _ThreeLevelDiv.__init__(self, tree, numeric=True)
         self._parse()
 
 
@@ -768,11 +738,11 @@ class PhStability(_ThreeLevelDiv):
     '''
     Parsing the pH STABILITY table in BRENDA.
     '''
-    def __init__(self, soup_instance):
-        _ThreeLevelDiv.__init__(self, soup_instance, numeric=True)
+    table_name = 'pH STABILITY'
+    table_id = 'tab47'
 
-        self.table_name = 'pH STABILITY'
-        self.table_id = 'tab47'
+    def __init__(self, tree):
+        _ThreeLevelDiv.__init__(self, tree, numeric=True)
         self._parse()
 
 
@@ -780,11 +750,11 @@ class TemperatureStability(_ThreeLevelDiv):
     '''
     Parsing the TEMPERATURE STABILITY table in BRENDA.
     '''
-    def __init__(self, soup_instance):
-        _ThreeLevelDiv.__init__(self, soup_instance, numeric=True)
+    table_name = 'TEMPERATURE STABILITY'
+    table_id = 'tab43'
 
-        self.table_name = 'TEMPERATURE STABILITY'
-        self.table_id = 'tab43'
+    def __init__(self, tree):
+        _ThreeLevelDiv.__init__(self, tree, numeric=True)
         self._parse()
 
 
@@ -796,11 +766,11 @@ class Km(_FourLevelDiv):
     '''
     Parsing the KM VALUE [mM] table in BRENDA.
     '''
-    def __init__(self, soup_instance):
-        _FourLevelDiv.__init__(self, soup_instance, numeric=True)
+    table_name = 'KM VALUE [mM]'
+    table_id = 'tab12'
 
-        self.table_name = 'KM VALUE [mM]'
-        self.table_id = 'tab12'
+    def __init__(self, tree):
+        _FourLevelDiv.__init__(self, tree, numeric=True)
         self._parse()
 
 
@@ -808,11 +778,11 @@ class Kcat(_FourLevelDiv):
     '''
     Parsing the TURNOVER NUMBER [1/s] table in BRENDA.
     '''
-    def __init__(self, soup_instance):
-        _FourLevelDiv.__init__(self, soup_instance, numeric=True)
+    table_name = 'TURNOVER NUMBER [1/s]'
+    table_id = 'tab44'
 
-        self.table_name = 'TURNOVER NUMBER [1/s]'
-        self.table_id = 'tab44'
+    def __init__(self, tree):
+        _FourLevelDiv.__init__(self, tree, numeric=True)
         self._parse()
 
 
@@ -820,11 +790,11 @@ class KcatDivKm(_FourLevelDiv):
     '''
     Parsing the kcat/KM VALUE [1/mMs-1] table in BRENDA.
     '''
-    def __init__(self, soup_instance):
-        _FourLevelDiv.__init__(self, soup_instance, numeric=True)
+    table_name = 'kcat/KM VALUE [1/mMs-1] '
+    table_id = 'tab305'
 
-        self.table_name = 'kcat/KM VALUE [1/mMs-1] '
-        self.table_id = 'tab305'
+    def __init__(self, tree):
+        _FourLevelDiv.__init__(self, tree, numeric=True)
         self._parse()
 
 
@@ -838,11 +808,11 @@ class Substrate(_FiveLevelDiv):
     '''
     Parsing the SUBSTRATE table in BRENDA.
     '''
-    def __init__(self, soup_instance):
-        _FiveLevelDiv.__init__(self, soup_instance, numeric=False)
+    table_name = 'SUBSTRATE'
+    table_id = 'tab37'
 
-        self.table_name = 'SUBSTRATE'
-        self.table_id = 'tab37'
+    def __init__(self, tree):
+        _FiveLevelDiv.__init__(self, tree, numeric=False)
         self._parse()
 
 
@@ -850,11 +820,11 @@ class NaturalSubstrate(_FiveLevelDiv):
     '''
     Parsing the NATURAL SUBSTRATE table in BRENDA.
     '''
-    def __init__(self, soup_instance):
-        _FiveLevelDiv.__init__(self, soup_instance, numeric=False)
+    table_name = 'NATURAL SUBSTRATE'
+    table_id = 'tab17'
 
-        self.table_name = 'NATURAL SUBSTRATE'
-        self.table_id = 'tab17'
+    def __init__(self, tree):
+        _FiveLevelDiv.__init__(self, tree, numeric=False)
         self._parse()
 
 
@@ -863,3 +833,63 @@ class NaturalSubstrate(_FiveLevelDiv):
 
 ### other ###
 
+# matched against the raw bytes of a file, so nothing needs to be decoded
+EC_NUMBER_REGEX = re.compile(rb'\d+\.\d+\.\d+\.[0-9A-Za-z]+')
+
+def find_ec_numbers(filepath):
+    '''
+    Scan an html file (for instance a BRENDA EC listing page) for EC numbers.
+    The file is searched as bytes in a single pass with a precompiled
+    regular expression.
+    Return the EC numbers as a sorted list of strings, without duplicates.
+    '''
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    return sorted(set(m.group().decode('ascii') for m in EC_NUMBER_REGEX.finditer(data)))
+
+
+def parse_all(tree, table_classes, uid_orgs_only=True):
+    '''
+    Parse several tables from one document tree.
+    Instead of each table class searching the whole document on its own,
+    the target tables are located in a single walk over the tree and each
+    class is handed its own table div.
+    Return a dictionary with the table names as keys and the parsed data as values.
+    '''
+    wanted = {table_class.table_id: table_class for table_class in table_classes}
+
+    #locate all target tables in one pass over the document
+    tables = {}
+    for div in tree.iter('div'):
+        div_id = div.get('id')
+        if div_id in wanted:
+            tables[div_id] = div
+
+    data = {}
+    for table_class in table_classes:
+        #tables missing from the page fall back to the (fruitless) full search
+        table = table_class(tables.get(table_class.table_id, tree))
+        data[table.table_name] = table.get_data(uid_orgs_only=uid_orgs_only)
+    return data
+
+
+def parse_ec_file(filepath, table_classes, uid_orgs_only=True):
+    '''
+    Parse a single EC html file with the supplied table classes.
+    Return a dictionary with the table names as keys and the parsed data as values.
+    '''
+    return parse_all(open_ec(filepath), table_classes, uid_orgs_only=uid_orgs_only)
+
+
+def parse_many(filepaths, table_classes, workers=None, uid_orgs_only=True):
+    '''
+    Parse many EC html files in parallel, one process per core by default.
+    Each file is independent and parsing is CPU-bound, so this scales close
+    to linearly with the number of cores.
+    Return a list with one parse_ec_file result per file, in input order.
+    '''
+    func = partial(parse_ec_file, table_classes=table_classes, uid_orgs_only=uid_orgs_only)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # chunksize amortizes the inter-process communication
+        return list(executor.map(func, filepaths, chunksize=16))
+
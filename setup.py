@@ -35,7 +35,7 @@ setup(
 	author_email='martin.engqvist@gmail.com',
 	url='https://github.com/EngqvistLab/brenparse',
         packages=find_packages(exclude=['contrib', 'docs', 'tests*']), #find folders containing scripts, exclude irrelevant ones
-        install_requires=['beautifulsoup4>=4.9.3'],
+        install_requires=['lxml>=4.0'],
         include_package_data=True,
 	license='GPLv3+',
 	classifiers=[